@@ -1,5 +1,6 @@
 import streamlit as st
-from utils import inject_global_css, render_hero, get_data, format_int
+from utils import inject_global_css, render_hero, get_data, get_snapshot
+from utils import STUDENT_NAME, MAJOR, UNIVERSITY, MATRICULATION_NUMBER, SEMINAR_NAME, LECTURER_NAME
 
 st.set_page_config(
     page_title="Popuinatlas — A Geo-Linguistic Atlas",
@@ -17,13 +18,6 @@ render_hero(
 
 cities, countries, langs, worldcities = get_data()
 
-STUDENT_NAME = "Ezzat Bachour"
-MAJOR = "B.Sc. Psychology"
-UNIVERSITY = "Leuphana University Lüneburg"
-MATRICULATION_NUMBER = "3045988"
-SEMINAR_NAME = "Mastering Data Visualization with Python (S)"
-LECTURER_NAME = "Jorge Gustavo Rodríguez Aboytes"
-
 left, right = st.columns([1.25, 1])
 
 with left:
@@ -62,10 +56,11 @@ with right:
 
     st.subheader("📦 Dataset snapshot")
     c1, c2, c3, c4 = st.columns(4)
-    c1.metric("Countries", format_int(countries.shape[0]))
-    c2.metric("Cities (MySQL)", format_int(cities.shape[0]))
-    c3.metric("Language rows", format_int(langs.shape[0]))
-    c4.metric("Worldcities (lat/lon)", format_int(worldcities.shape[0]) if worldcities is not None else "—")
+    snap = get_snapshot()
+    c1.metric("Countries", snap["countries"])
+    c2.metric("Cities (MySQL)", snap["cities"])
+    c3.metric("Language rows", snap["langs"])
+    c4.metric("Worldcities (lat/lon)", snap["worldcities"])
 
 st.divider()
 
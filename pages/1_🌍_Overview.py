@@ -1,22 +1,41 @@
+import pandas as pd
 import streamlit as st
-import plotly.express as px
 
-from utils import inject_global_css, render_hero, get_data, build_country_language_stats, build_global_language_stats
+from utils import inject_global_css, render_hero, get_data, build_country_language_stats, build_global_language_stats, get_snapshot, choropleth_fig, population_scatter_fig
 
 st.set_page_config(page_title="Overview — Popuinatlas", page_icon="🌍", layout="wide")
 inject_global_css()
 render_hero("🌍", "Overview", "Global KPIs and the highest-signal maps from the dataset.", pill="Global view")
 
-cities, countries, langs, _ = get_data()
+_, countries, langs, _ = get_data()
+
+
+@st.cache_data(show_spinner=False)
+def top_languages_fig(top: pd.DataFrame) -> dict:
+    import plotly.express as px
+
+    fig = px.bar(
+        top,
+        x="countries_spoken",
+        y="Language",
+        orientation="h",
+        template="plotly_dark",
+        title="Top 20 languages",
+    )
+    fig.update_layout(margin=dict(l=0, r=0, t=60, b=0), yaxis={"categoryorder": "total ascending"})
+    return fig.to_dict()
+
 
 stats = build_country_language_stats(countries, langs)
 global_lang = build_global_language_stats(langs, countries)
+avg_langs = float(stats["n_languages"].mean()) if "n_languages" in stats.columns else None
+snap = get_snapshot()
 
 c1, c2, c3, c4 = st.columns(4)
-c1.metric("Countries", f"{countries.shape[0]:,}")
-c2.metric("Unique languages", f"{langs['Language'].nunique():,}" if "Language" in langs.columns else "—")
-c3.metric("Cities", f"{cities.shape[0]:,}")
-c4.metric("Avg languages/country", f"{stats['n_languages'].mean():.2f}" if "n_languages" in stats.columns else "—")
+c1.metric("Countries", snap["countries"])
+c2.metric("Unique languages", snap["unique_langs"])
+c3.metric("Cities", snap["cities"])
+c4.metric("Avg languages/country", f"{avg_langs:.2f}" if avg_langs is not None else "—")
 
 st.divider()
 
@@ -24,48 +43,20 @@ left, right = st.columns([1.25, 1])
 
 with left:
     st.subheader("Languages per country")
-    fig = px.choropleth(
-        stats,
-        locations="Code",
-        locationmode="ISO-3",
-        color="n_languages",
-        hover_name="Name" if "Name" in stats.columns else None,
-        hover_data={k: True for k in ["n_official", "Population"] if k in stats.columns},
-        template="plotly_dark",
-        title="Language diversity (count of listed languages)",
+    st.plotly_chart(
+        choropleth_fig(stats, "n_languages", "Language diversity (count of listed languages)", ("n_official", "Population")),
+        use_container_width=True,
     )
-    fig.update_layout(margin=dict(l=0, r=0, t=60, b=0), height=520)
-    st.plotly_chart(fig, use_container_width=True)
 
 with right:
     st.subheader("Top languages (by number of countries where listed)")
-    top = global_lang.head(20).copy()
-    fig2 = px.bar(
-        top,
-        x="countries_spoken",
-        y="Language",
-        orientation="h",
-        template="plotly_dark",
-        title="Top 20 languages",
-    )
-    fig2.update_layout(margin=dict(l=0, r=0, t=60, b=0), yaxis={"categoryorder": "total ascending"})
-    st.plotly_chart(fig2, use_container_width=True)
+    st.plotly_chart(top_languages_fig(global_lang.iloc[:20]), use_container_width=True)
 
 st.divider()
 
 st.subheader("Population vs language count")
 if "Population" in stats.columns:
-    df = stats.dropna(subset=["Population", "n_languages"]).copy()
-    fig3 = px.scatter(
-        df,
-        x="Population",
-        y="n_languages",
-        hover_name="Name" if "Name" in df.columns else None,
-        color="Continent" if "Continent" in df.columns else None,
-        template="plotly_dark",
-        title="Do larger populations correlate with more listed languages?",
-    )
-    fig3.update_layout(margin=dict(l=0, r=0, t=60, b=0))
-    st.plotly_chart(fig3, use_container_width=True)
+    fig = population_scatter_fig(stats, "Do larger populations correlate with more listed languages?")
+    st.plotly_chart(fig, use_container_width=True)
 else:
     st.info("Population column not available in your country table.")
@@ -1,8 +1,11 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 from utils import format_int
-from utils import inject_global_css, render_hero
+from utils import inject_global_css, render_hero, get_data, frame_key
+
+st.set_page_config(page_title="Country Explorer — Popuinatlas", page_icon="🧭", layout="wide")
 inject_global_css()
 render_hero(
     "🧭",
@@ -12,44 +15,129 @@ render_hero(
 )
 
 
+@st.cache_data(show_spinner=False)
+def _prep(countries_raw: pd.DataFrame, cities_raw: pd.DataFrame, langs_raw: pd.DataFrame):
+    """
+    Typed, labelled copies of the shared frames, the selectbox labels, the
+    label <-> ISO3 maps, row positions for langs (keyed by
+    (CountryCode, is_official)) and cities (keyed by CountryCode), and a
+    content key for langs, once per dataset.
+    Cities are ordered by population within each country.
+    """
+    countries = countries_raw.dropna(subset=["Code", "Name"])
+    countries = countries.assign(Code=countries["Code"].astype(str), Name=countries["Name"].astype(str))
+
+    countries["_label"] = countries["Name"] + " (" + countries["Code"] + ")"
+    countries = countries.sort_values("_label").reset_index(drop=True)
+
+    labels = tuple(countries["_label"])
+    label_to_iso3 = dict(zip(countries["_label"], countries["Code"]))
+    iso3_to_label = dict(zip(countries["Code"], countries["_label"]))
 
-st.set_page_config(page_title="Country Explorer", layout="wide")
-st.title("🧭 Country Explorer")
-st.caption("Tip: **Double-click** a country on the map to select it. Single-click only highlights. You can also use the sidebar.")
+    langs = langs_raw
+    if "Percentage" in langs.columns:
+        langs = langs.assign(Percentage=pd.to_numeric(langs["Percentage"], errors="coerce"))
 
+    cities = cities_raw
+    if "Population" in cities.columns:
+        cities = cities.sort_values(["CountryCode", "Population"], ascending=[True, False]).reset_index(drop=True)
 
-required = {"countries", "cities", "languages"}
-if not required.issubset(st.session_state.keys()):
-    st.error("Open Home first (main.py).")
-    st.stop()
+    if "IsOfficial" in langs.columns:
+        is_official = langs["IsOfficial"].to_numpy(dtype=bool)
+    else:
+        is_official = np.zeros(len(langs), dtype=bool)
+    lang_idx = langs.groupby([langs["CountryCode"], is_official], sort=False, observed=True).indices
+    city_idx = cities.groupby("CountryCode", sort=False, observed=True).indices
 
-countries = st.session_state["countries"].copy()
-cities = st.session_state["cities"].copy()
-langs = st.session_state["languages"].copy()
+    return countries, cities, langs, labels, label_to_iso3, iso3_to_label, lang_idx, city_idx, frame_key(langs)
 
 
-countries = countries.dropna(subset=["Code", "Name"]).copy()
-countries["Code"] = countries["Code"].astype(str)
-countries["Name"] = countries["Name"].astype(str)
+@st.cache_data(show_spinner=False)
+def _base_map(codes: tuple, names: tuple) -> dict:
+    """World choropleth with nothing highlighted; callers set data[0].z per selection."""
+    fig = px.choropleth(
+        pd.DataFrame({"Code": codes, "Name": names, "_highlight": 0}),
+        locations="Code",
+        locationmode="ISO-3",
+        color="_highlight",
+        hover_name="Name",
+        custom_data=["Code"],
+        template="plotly_dark",
+        title="World map (click a country to select it)",
+        range_color=(0, 1),
+        color_continuous_scale=[(0.0, "#0d0887"), (1.0, "#f0f921")],
+    )
 
-countries["_label"] = countries["Name"] + " (" + countries["Code"] + ")"
-countries = countries.sort_values("_label").reset_index(drop=True)
+    fig.update_traces(
+        marker_line_width=0.6,
+        marker_line_color="rgba(255,255,255,0.30)",
+        hovertemplate="<b>%{hovertext}</b><extra></extra>",
+    )
 
-label_to_iso3 = dict(zip(countries["_label"], countries["Code"]))
-iso3_to_label = dict(zip(countries["Code"], countries["_label"]))
+    fig.update_layout(
+        coloraxis_showscale=False,
+        height=560,
+        margin=dict(l=0, r=0, t=60, b=0),
+        clickmode="event+select",
+        geo=dict(
+            projection_type="natural earth",
+            showframe=False,
+            showcountries=True,
+            countrycolor="rgba(255,255,255,0.22)",
+            showcoastlines=True,
+            coastlinecolor="rgba(255,255,255,0.15)",
+            showocean=True,
+            oceancolor="rgb(12,16,25)",
+            showland=True,
+            landcolor="rgb(20,25,35)",
+            bgcolor="rgba(0,0,0,0)",
+        ),
+    )
+    return fig.to_dict()
+
+
+NO_ROWS = np.empty(0, dtype=np.int64)
+
+
+@st.cache_data(show_spinner=False)
+def _lang_table(_langs: pd.DataFrame, _lang_idx: dict, langs_key: int, iso3: str, official: bool) -> pd.DataFrame:
+    """
+    Display table of a country's official (or other) languages, most
+    prevalent first. The frames are not hashed; langs_key (from _prep)
+    stands in for them, so a reloaded dataset gets fresh tables.
+    """
+    df = _langs.take(_lang_idx.get((iso3, official), NO_ROWS))
+    if "Percentage" in df.columns and df["Percentage"].notna().any():
+        df = df.sort_values("Percentage", ascending=False)
+        pct = df["Percentage"].to_numpy(dtype=float)
+        out = df[["Language"]].assign(Percentage=np.where(np.isnan(pct), "—", np.char.mod("%.2f%%", pct)))
+    else:
+        out = df[["Language"]]
+    return out.reset_index(drop=True)
+
+cities_raw, countries_raw, langs_raw, _ = get_data()
+countries, cities, langs, labels, label_to_iso3, iso3_to_label, lang_idx, city_idx, langs_key = _prep(
+    countries_raw, cities_raw, langs_raw
+)
 
 if "selected_iso3" not in st.session_state:
     st.session_state["selected_iso3"] = countries["Code"].iloc[0]
 
 SELECTBOX_KEY = "country_selectbox_country_explorer"
 
+selected_iso3 = str(st.session_state["selected_iso3"])
+selected_label = iso3_to_label.get(selected_iso3, labels[0])
+
 def set_country(iso3: str):
-    """Update country selection everywhere (session + selectbox)."""
+    """Update the country selection; the sidebar selectbox follows it on the next run."""
     iso3 = str(iso3)
     if iso3 not in iso3_to_label:
         return
     st.session_state["selected_iso3"] = iso3
-    st.session_state[SELECTBOX_KEY] = iso3_to_label[iso3]
+
+def on_dropdown_change():
+    """Selectbox callback: runs before the rerun, so the page renders the picked country."""
+    set_country(label_to_iso3[st.session_state[SELECTBOX_KEY]])
 
 def get_clicked_iso3(selection_obj):
     """
@@ -91,20 +179,15 @@ def get_clicked_iso3(selection_obj):
 with st.sidebar:
     st.header("Controls")
 
-    current_iso3 = str(st.session_state["selected_iso3"])
-    st.session_state[SELECTBOX_KEY] = iso3_to_label.get(current_iso3, countries["_label"].iloc[0])
+    st.session_state[SELECTBOX_KEY] = selected_label
 
-    selected_label = st.selectbox(
+    st.selectbox(
         "Select a country",
-        options=countries["_label"].tolist(),
+        options=labels,
         key=SELECTBOX_KEY,
+        on_change=on_dropdown_change,
     )
 
-    dropdown_iso3 = label_to_iso3[selected_label]
-    if dropdown_iso3 != st.session_state["selected_iso3"]:
-        set_country(dropdown_iso3)
-        st.rerun()
-
     st.divider()
     debug = st.toggle("Debug mode", value=False)
 
@@ -113,47 +196,8 @@ left, right = st.columns([1.6, 1])
 
 
 with left:
-    selected_iso3 = str(st.session_state["selected_iso3"])
-
-    countries["_highlight"] = (countries["Code"] == selected_iso3).astype(int)
-
-    fig = px.choropleth(
-        countries,
-        locations="Code",
-        locationmode="ISO-3",
-        color="_highlight",
-        hover_name="Name",
-        custom_data=["Code"],  
-        template="plotly_dark",
-        title="World map (click a country to select it)",
-        range_color=(0, 1),
-    )
-
-    fig.update_traces(
-        marker_line_width=0.6,
-        marker_line_color="rgba(255,255,255,0.30)",
-        hovertemplate="<b>%{hovertext}</b><extra></extra>",
-    )
-
-    fig.update_layout(
-        coloraxis_showscale=False,
-        height=560,
-        margin=dict(l=0, r=0, t=60, b=0),
-        clickmode="event+select", 
-        geo=dict(
-            projection_type="natural earth",
-            showframe=False,
-            showcountries=True,
-            countrycolor="rgba(255,255,255,0.22)",
-            showcoastlines=True,
-            coastlinecolor="rgba(255,255,255,0.15)",
-            showocean=True,
-            oceancolor="rgb(12,16,25)",
-            showland=True,
-            landcolor="rgb(20,25,35)",
-            bgcolor="rgba(0,0,0,0)",
-        ),
-    )
+    fig = _base_map(tuple(countries["Code"]), tuple(countries["Name"]))
+    fig["data"][0]["z"] = (countries["Code"].to_numpy() == selected_iso3).astype("int8")
 
     selection = st.plotly_chart(
         fig,
@@ -167,13 +211,12 @@ with left:
         st.write("raw selection:", selection)
 
     clicked_iso3 = get_clicked_iso3(selection)
-    if clicked_iso3 and clicked_iso3 != st.session_state["selected_iso3"]:
+    if clicked_iso3 and clicked_iso3 != selected_iso3:
         set_country(clicked_iso3)
         st.rerun()
 
 
 with right:
-    selected_iso3 = str(st.session_state["selected_iso3"])
     row = countries[countries["Code"] == selected_iso3].head(1)
 
     name = row["Name"].iloc[0] if not row.empty else selected_iso3
@@ -195,23 +238,12 @@ st.divider()
 
 
 st.subheader("🗣️ Languages")
-selected_iso3 = str(st.session_state["selected_iso3"])
-country_langs = langs[langs["CountryCode"].astype(str) == selected_iso3].copy()
+official = _lang_table(langs, lang_idx, langs_key, selected_iso3, True)
+other = _lang_table(langs, lang_idx, langs_key, selected_iso3, False)
 
-if country_langs.empty:
+if official.empty and other.empty:
     st.warning("No language rows found for this country.")
 else:
-    if "IsOfficial" in country_langs.columns:
-        country_langs["IsOfficial"] = country_langs["IsOfficial"].astype(str).str.upper()
-    else:
-        country_langs["IsOfficial"] = "?"
-
-    if "Percentage" in country_langs.columns:
-        country_langs["Percentage"] = pd.to_numeric(country_langs["Percentage"], errors="coerce")
-
-    official = country_langs[country_langs["IsOfficial"] == "T"].copy()
-    other = country_langs[country_langs["IsOfficial"] != "T"].copy()
-
     c1, c2 = st.columns(2)
 
     def render_lang(df: pd.DataFrame, title: str):
@@ -219,13 +251,7 @@ else:
         if df.empty:
             st.write("—")
             return
-        if "Percentage" in df.columns and df["Percentage"].notna().any():
-            df = df.sort_values("Percentage", ascending=False)
-            out = df[["Language", "Percentage"]].copy()
-            out["Percentage"] = out["Percentage"].map(lambda x: f"{x:.2f}%" if pd.notna(x) else "—")
-        else:
-            out = df[["Language"]].copy()
-        st.dataframe(out.reset_index(drop=True), use_container_width=True)
+        st.dataframe(df, use_container_width=True)
 
     with c1:
         render_lang(official, "🏛️ Official")
@@ -236,18 +262,15 @@ st.divider()
 
 
 st.subheader("🏙️ Cities (top by population)")
-country_cities = cities[cities["CountryCode"].astype(str) == selected_iso3].copy()
+country_cities = cities.take(city_idx.get(selected_iso3, NO_ROWS))
 
 if country_cities.empty:
     st.write("No cities found for this country.")
 else:
     top_n = st.slider("How many cities?", 5, 30, 10, 5, key="top_n_country_explorer")
 
-    if "Population" in country_cities.columns:
-        country_cities["Population"] = pd.to_numeric(country_cities["Population"], errors="coerce")
-
     city_name_col = "Name" if "Name" in country_cities.columns else "Name"
-    top = country_cities.sort_values("Population", ascending=False).head(top_n)
+    top = country_cities.head(top_n)
 
     cols = [city_name_col]
     if "District" in top.columns:
@@ -1,6 +1,10 @@
 import streamlit as st
+import numpy as np
+import pandas as pd
 import plotly.express as px
-from utils import inject_global_css, render_hero
+from utils import inject_global_css, render_hero, get_data
+
+st.set_page_config(page_title="Language Explorer — Popuinatlas", page_icon="🗣️", layout="wide")
 inject_global_css()
 render_hero(
     "🗣️",
@@ -9,32 +13,50 @@ render_hero(
     pill="Languages",
 )
 
+_, countries, langs, _ = get_data()
+
+
+@st.cache_data(show_spinner=False)
+def _country_lookup(countries: pd.DataFrame) -> pd.DataFrame:
+    """Country attributes indexed by ISO3 code, for Series.map lookups."""
+    return countries.set_index("Code")[["Name", "Continent", "Region", "Population"]]
+
 
-st.set_page_config(page_title="Language Explorer", layout="wide")
-st.title("🗣️ Language Explorer")
-st.caption("Pick a language → see where it is listed, official status, and prevalence (if available).")
+@st.cache_data(show_spinner=False)
+def _lang_index(langs: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+    """
+    langs ordered by prevalence (highest first) plus the row positions of each
+    language in it, so a selection is a take() of rows already in table order.
+    """
+    if "Percentage" in langs.columns:
+        langs = langs.sort_values("Percentage", ascending=False, na_position="last", kind="stable")
+    langs = langs.reset_index(drop=True)
+    return langs, langs.groupby("Language", sort=False, observed=True).indices
 
-if not {"countries", "languages"}.issubset(st.session_state.keys()):
-    st.error("Open Home first (main.py).")
-    st.stop()
 
-countries = st.session_state["countries"]
-langs = st.session_state["languages"]
+@st.cache_data(show_spinner=False)
+def _all_langs(langs: pd.DataFrame) -> list[str]:
+    return sorted(langs["Language"].dropna().unique().tolist())
 
-all_langs = sorted(langs["Language"].dropna().unique().tolist())
+
+NO_ROWS = np.empty(0, dtype=np.int64)
+
+country_lookup = _country_lookup(countries)
+langs_by_pct, lang_by_name = _lang_index(langs)
+
+all_langs = _all_langs(langs)
 selected = st.selectbox("Choose a language", all_langs, key="language_selectbox")
 
-filtered = langs[langs["Language"] == selected].copy()
-merged = filtered.merge(
-    countries[["Code", "Name", "Continent", "Region", "Population"]],
-    left_on="CountryCode",
-    right_on="Code",
-    how="left",
+filtered = langs_by_pct.take(lang_by_name.get(selected, NO_ROWS))
+merged = filtered.assign(
+    Code=filtered["CountryCode"],
+    _is_off=filtered["IsOfficial"].astype("int32"),
+    **{col: filtered["CountryCode"].map(country_lookup[col]) for col in country_lookup.columns},
 )
 
 k1, k2, k3 = st.columns(3)
 k1.metric("Countries where listed", f"{merged['Name'].nunique():,}")
-k2.metric("Official rows", f"{int((merged.get('IsOfficial','')=='T').sum()):,}")
+k2.metric("Official rows", f"{int(merged['_is_off'].sum()):,}")
 k3.metric("Avg % (if available)", f"{merged['Percentage'].mean():.2f}%" if "Percentage" in merged.columns and merged["Percentage"].notna().any() else "—")
 
 st.divider()
@@ -71,9 +93,9 @@ with left:
     st.plotly_chart(fig, use_container_width=True)
 
 with right:
-    by_cont = merged.groupby("Continent").agg(
+    by_cont = merged.groupby("Continent", sort=False, observed=True).agg(
         countries=("Code", "nunique"),
-        official=("IsOfficial", lambda s: int((s == "T").sum())),
+        official=("_is_off", "sum"),
     ).reset_index().sort_values("countries", ascending=False)
 
     fig2 = px.bar(by_cont, x="countries", y="Continent", orientation="h",
@@ -88,7 +110,4 @@ cols = ["Name", "Continent", "Region", "IsOfficial"]
 if "Percentage" in merged.columns:
     cols.append("Percentage")
 
-st.dataframe(
-    merged[cols].sort_values("Percentage", ascending=False) if "Percentage" in merged.columns else merged[cols],
-    use_container_width=True
-)
+st.dataframe(merged[cols], use_container_width=True)
@@ -1,8 +1,9 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 
-from utils import inject_global_css, render_hero
+from utils import inject_global_css, render_hero, get_data, frame_key
 
 
 st.set_page_config(page_title="City Analytics + City Map — Popuinatlas", page_icon="🏙️", layout="wide")
@@ -16,60 +17,162 @@ render_hero(
 )
 
 
-required = {"countries", "cities", "languages", "worldcities"}
-missing = [k for k in required if k not in st.session_state]
-if missing:
-    st.error(f"Missing in session_state: {missing}. Open **Home (main.py)** once to load data.")
-    st.stop()
-
-countries = st.session_state["countries"].copy()
-cities_mysql = st.session_state["cities"].copy()
-worldcities = st.session_state["worldcities"]  
-
-tab_map, tab_analytics = st.tabs(["🗺️ City Map (Lat/Lon)", "📈 City Analytics (Population)"])
+cities_mysql, countries, _, worldcities = get_data()
+
+# Above this many cities the map switches from Plotly's SVG scatter_geo to a WebGL deck.gl layer.
+WEBGL_MIN_POINTS = 5000
+# Rank-size curves are thinned to at most this many log-spaced ranks per country.
+RANK_CURVE_POINTS = 200
+
+
+@st.cache_data(show_spinner=False)
+def labelled_countries(countries: pd.DataFrame) -> tuple[dict, dict]:
+    """
+    Sorted "Name (ISO3)" labels per continent, keyed "All" first and then by
+    continent name so the keys double as the selectbox options, plus the
+    label -> ISO3 map; the string work and sorting run once per dataset.
+    """
+    cdf = countries.dropna(subset=["Code", "Name"])
+    cdf = cdf.assign(Code=cdf["Code"].astype(str).str.strip(), Name=cdf["Name"].astype(str).str.strip())
+    cdf["_label"] = cdf["Name"].str.cat(cdf["Code"], sep=" (") + ")"
+    cdf = cdf.sort_values("_label")
+    options = {"All": cdf["_label"].tolist()}
+    if "Continent" in cdf.columns:
+        groups = {str(cont): grp["_label"].tolist() for cont, grp in cdf.groupby("Continent", observed=True)}
+        options.update(sorted(groups.items()))
+    return options, dict(zip(cdf["_label"], cdf["Code"]))
+
+
+@st.cache_data(show_spinner=False)
+def ranked_cities(cities: pd.DataFrame) -> pd.DataFrame:
+    """Cities with a population, by country and then largest first, with their 1-based rank in the country."""
+    ranked = cities.dropna(subset=["Population"])
+    ranked = ranked.sort_values(["CountryCode", "Population"], ascending=[True, False], kind="stable")
+    return ranked.assign(rank=ranked.groupby("CountryCode", observed=True).cumcount() + 1).reset_index(drop=True)
+
+
+def log_spaced_ranks(ranked: pd.DataFrame, k: int = RANK_CURVE_POINTS) -> pd.DataFrame:
+    """
+    Keeps, per country, the first rank of each of k log-spaced bins, so a
+    country contributes at most k points and small countries keep all ranks.
+    """
+    n = ranked.groupby("CountryCode", observed=True)["rank"].transform("size").to_numpy()
+    r = ranked["rank"].to_numpy()
+    if (n <= k).all():
+        return ranked
+    scale = (k - 1) / np.log(np.maximum(n, 2))
+    first_in_bin = np.floor(np.log(r) * scale) != np.floor(np.log(np.maximum(r - 1, 1)) * scale)
+    return ranked[(n <= k) | (r == 1) | first_in_bin]
+
+
+def _first_present(columns, candidates) -> str | None:
+    return next((c for c in candidates if c in columns), None)
+
+
+@st.cache_data(show_spinner=False)
+def prep_worldcities(worldcities: pd.DataFrame) -> tuple[pd.DataFrame, dict, int]:
+    """
+    Resolves the worldcities column names once (None when absent) and returns
+    the table with numeric coordinates/population, a stripped categorical iso3
+    and no rows lacking coordinates, ordered by population (largest first).
+    The repeated country/admin names are stored as categoricals. The int is
+    a content key of the returned table for city_map_fig's cache.
+    """
+    cols = {
+        "lat": _first_present(worldcities.columns, ["lat", "latitude", "LAT", "Latitude"]),
+        "lon": _first_present(worldcities.columns, ["lon", "lng", "longitude", "LON", "LNG", "Longitude"]),
+        "iso3": _first_present(worldcities.columns, ["iso3"]),
+        "pop": _first_present(worldcities.columns, ["population"]),
+        "city": _first_present(worldcities.columns, ["city", "city_ascii", "name", "Name"]),
+        "admin": _first_present(worldcities.columns, ["admin_name"]),
+        "country": _first_present(worldcities.columns, ["country"]),
+    }
+    if not cols["lat"] or not cols["lon"]:
+        return worldcities, cols, frame_key(worldcities)
+
+    # 4 decimals (~11 m) is finer than any scatter_geo zoom; float32 halves the
+    # typed arrays Plotly ships, and the hover re-rounds to hide float32 noise.
+    wc = worldcities.assign(**{
+        c: pd.to_numeric(worldcities[c], errors="coerce").round(4).astype("float32")
+        for c in (cols["lat"], cols["lon"])
+    })
+    wc = wc.dropna(subset=[cols["lat"], cols["lon"]])
+    if cols["pop"]:
+        wc = wc.assign(**{cols["pop"]: pd.to_numeric(wc[cols["pop"]], errors="coerce")})
+        wc = wc.sort_values(cols["pop"], ascending=False, na_position="last", kind="stable")
+    if cols["iso3"]:
+        wc = wc.assign(**{cols["iso3"]: wc[cols["iso3"]].astype(str).str.strip().astype("category")})
+    repeated = [cols[k] for k in ("country", "admin") if cols[k]]
+    if repeated:
+        wc = wc.assign(**{c: wc[c].astype("category") for c in repeated})
+    return wc, cols, frame_key(wc)
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def city_map_fig(
+    _df: pd.DataFrame,
+    wc_key: int,
+    selection: tuple,
+    projection: str,
+    lat_col: str,
+    lon_col: str,
+    city_col: str | None,
+    hover_cols: tuple,
+    pop_col: str | None,
+) -> dict:
+    """
+    scatter_geo of the filtered cities. _df is not hashed: wc_key (the
+    dataset) and `selection` (min_pop, max_points, iso3) identify it, so the
+    figure is only rebuilt for new data, new filters or another projection.
+    """
+    fig = px.scatter_geo(
+        _df,
+        lat=lat_col,
+        lon=lon_col,
+        hover_name=city_col if city_col else None,
+        hover_data=list(hover_cols) if hover_cols else None,
+        size=pop_col if pop_col else None,
+        projection=projection,
+        template="plotly_dark",
+        title="Cities (zoom / pan / hover)",
+    )
+    hover = fig.data[0].hovertemplate.replace("%{lat}", "%{lat:.4f}").replace("%{lon}", "%{lon:.4f}")
+    fig.update_traces(hovertemplate=hover)
 
+    fig.update_layout(
+        height=720,
+        margin=dict(l=0, r=0, t=60, b=0),
+        geo=dict(
+            showocean=True,
+            oceancolor="rgb(12,16,25)",
+            showland=True,
+            landcolor="rgb(20,25,35)",
+            showcountries=True,
+            countrycolor="rgba(255,255,255,0.22)",
+            bgcolor="rgba(0,0,0,0)",
+        ),
+    )
+    return fig.to_dict()
 
 
-with tab_map:
+@st.fragment
+def city_map_tab() -> None:
     if worldcities is None or (isinstance(worldcities, pd.DataFrame) and worldcities.empty):
         st.error("worldcities.csv is missing or empty. Put it at `data/worldcities.csv` and redeploy/restart.")
-        st.stop()
+        return
 
-    wc = worldcities.copy()
-
-    wc.columns = [str(c).strip() for c in wc.columns]
-
-    lat_col = None
-    lon_col = None
-
-    for cand in ["lat", "latitude", "LAT", "Latitude"]:
-        if cand in wc.columns:
-            lat_col = cand
-            break
-
-    for cand in ["lon", "lng", "longitude", "LON", "LNG", "Longitude"]:
-        if cand in wc.columns:
-            lon_col = cand
-            break
+    wc, wc_cols, wc_key = prep_worldcities(worldcities)
+    lat_col, lon_col = wc_cols["lat"], wc_cols["lon"]
 
     if not lat_col or not lon_col:
         st.error(
             f"worldcities.csv must contain latitude/longitude columns. "
             f"Expected 'lat' + ('lon' or 'lng'). Found: {wc.columns.tolist()}"
         )
-        st.stop()
-
-    iso3_col = "iso3" if "iso3" in wc.columns else None
-    pop_col = "population" if "population" in wc.columns else None
+        return
 
-    city_col = None
-    for cand in ["city", "city_ascii", "name", "Name"]:
-        if cand in wc.columns:
-            city_col = cand
-            break
-
-    admin_col = "admin_name" if "admin_name" in wc.columns else None
-    country_col = "country" if "country" in wc.columns else None
+    iso3_col, pop_col = wc_cols["iso3"], wc_cols["pop"]
+    city_col, admin_col, country_col = wc_cols["city"], wc_cols["admin"], wc_cols["country"]
 
     c1, c2, c3 = st.columns([1.1, 1, 1])
     with c1:
@@ -81,34 +184,22 @@ with tab_map:
 
     chosen_iso3 = None
     if "Code" in countries.columns and "Name" in countries.columns and iso3_col:
-        cdf = countries.dropna(subset=["Code", "Name"]).copy()
-        cdf["Code"] = cdf["Code"].astype(str).str.strip()
-        cdf["Name"] = cdf["Name"].astype(str).str.strip()
-        cdf["_label"] = cdf["Name"] + " (" + cdf["Code"] + ")"
-        cdf = cdf.sort_values("_label")
-        pick = st.selectbox("Country filter (optional)", ["All"] + cdf["_label"].tolist())
+        options_by_continent, label_to_code = labelled_countries(countries)
+        pick = st.selectbox("Country filter (optional)", ["All"] + options_by_continent["All"])
         if pick != "All":
-            chosen_iso3 = pick.split("(")[-1].replace(")", "").strip()
+            chosen_iso3 = label_to_code[pick]
     else:
         st.caption("Country filter is disabled (missing countries Code/Name or worldcities iso3 column).")
 
-    df = wc.dropna(subset=[lat_col, lon_col]).copy()
-    df[lat_col] = pd.to_numeric(df[lat_col], errors="coerce")
-    df[lon_col] = pd.to_numeric(df[lon_col], errors="coerce")
-    df = df.dropna(subset=[lat_col, lon_col])
-
+    df = wc
     if pop_col:
-        df[pop_col] = pd.to_numeric(df[pop_col], errors="coerce")
         df = df[df[pop_col].fillna(0) >= min_pop]
 
     if chosen_iso3 and iso3_col:
-        df[iso3_col] = df[iso3_col].astype(str).str.strip()
         df = df[df[iso3_col] == chosen_iso3]
 
-    if pop_col and df[pop_col].notna().any():
-        df = df.sort_values(pop_col, ascending=False).head(max_points)
-    else:
-        df = df.head(max_points)
+    # prep_worldcities keeps rows largest-first and the filters above preserve order.
+    df = df.head(max_points)
 
     st.write(f"Showing **{len(df):,}** cities")
 
@@ -116,43 +207,56 @@ with tab_map:
     for col in [country_col, admin_col, pop_col]:
         if col and col in df.columns:
             hover_cols.append(col)
-
-    fig = px.scatter_geo(
-        df,
-        lat=lat_col,
-        lon=lon_col,
-        hover_name=city_col if city_col else None,
-        hover_data=hover_cols if hover_cols else None,
-        size=pop_col if pop_col else None,
-        projection=projection,
-        template="plotly_dark",
-        title="Cities (zoom / pan / hover)",
-    )
-
-    fig.update_layout(
-        height=720,
-        margin=dict(l=0, r=0, t=60, b=0),
-        geo=dict(
-            showocean=True,
-            oceancolor="rgb(12,16,25)",
-            showland=True,
-            landcolor="rgb(20,25,35)",
-            showcountries=True,
-            countrycolor="rgba(255,255,255,0.22)",
-            bgcolor="rgba(0,0,0,0)",
-        ),
-    )
-
-    st.plotly_chart(fig, use_container_width=True)
-
+    df = df[[c for c in [lat_col, lon_col, city_col, *hover_cols] if c]]
+
+    if len(df) > WEBGL_MIN_POINTS:
+        import pydeck as pdk
+
+        st.caption("Large selection: drawn with WebGL. The projection setting applies to smaller selections only.")
+        # pydeck sends JSON records, where float64 prints shorter than float32.
+        layer_df = df.assign(**{c: df[c].astype("float64").round(4) for c in (lat_col, lon_col)})
+        if pop_col:
+            # deck.gl's JSON converter rejects function calls in @@= expressions, so
+            # the radius is precomputed here; whole-number population keeps the tooltip clean.
+            pop = layer_df[pop_col].fillna(0).round().astype("int64")
+            layer_df = layer_df.assign(**{pop_col: pop, "_radius": (np.sqrt(pop) * 20).round(1)})
+        # Missing hover text would reach the deck JSON as bare NaN and show up as "NaN".
+        text_cols = [c for c in [city_col, *hover_cols] if c and c != pop_col]
+        layer_df = layer_df.assign(**{c: layer_df[c].astype("string").fillna("—") for c in text_cols})
+        tooltip = "\n".join(f"{{{c}}}" for c in [city_col, *hover_cols] if c)
+        st.pydeck_chart(
+            pdk.Deck(
+                layers=[
+                    pdk.Layer(
+                        "ScatterplotLayer",
+                        data=layer_df,
+                        get_position=f"[{lon_col}, {lat_col}]",
+                        get_radius="_radius" if pop_col else 20000,
+                        radius_min_pixels=1,
+                        get_fill_color=[99, 110, 250, 170],
+                        pickable=True,
+                    )
+                ],
+                initial_view_state=pdk.ViewState(latitude=20, longitude=0, zoom=1),
+                tooltip={"text": tooltip} if tooltip else None,
+            ),
+            height=720,
+        )
+    else:
+        fig = city_map_fig(
+            df, wc_key, (min_pop, max_points, chosen_iso3), projection,
+            lat_col, lon_col, city_col, tuple(hover_cols), pop_col,
+        )
+        st.plotly_chart(fig, use_container_width=True)
 
 
-with tab_analytics:
+@st.fragment
+def city_analytics_tab() -> None:
     st.subheader("📈 Urban concentration patterns (city.csv)")
     st.caption("Analytics use the MySQL world dataset's city table (population, rankings, concentration).")
 
-    cities = cities_mysql.copy()
-    ctry = countries.copy()
+    cities = cities_mysql
+    ctry = countries
 
     needed_cols = {"CountryCode", "Population"}
     if not needed_cols.issubset(set(cities.columns)):
@@ -160,55 +264,34 @@ with tab_analytics:
             f"`cities` table is missing required columns {needed_cols}. "
             f"Found: {cities.columns.tolist()}"
         )
-        st.stop()
+        return
 
-    cities["CountryCode"] = cities["CountryCode"].astype(str).str.strip()
-    cities["Population"] = pd.to_numeric(cities["Population"], errors="coerce")
+    if not {"Code", "Name"}.issubset(set(ctry.columns)):
+        st.error("Countries table must include 'Code' and 'Name'.")
+        return
 
+    options_by_continent, label_to_code = labelled_countries(ctry)
     if "Continent" not in ctry.columns:
         st.warning("Countries table has no 'Continent' column — continent filter disabled.")
-        conts = ["All"]
-    else:
-        conts = ["All"] + sorted(ctry["Continent"].dropna().astype(str).unique().tolist())
-
-    sel_cont = st.selectbox("Continent", conts)
-
-    filtered_countries = ctry.copy()
-    if sel_cont != "All" and "Continent" in filtered_countries.columns:
-        filtered_countries = filtered_countries[filtered_countries["Continent"] == sel_cont]
-
-    if not {"Code", "Name"}.issubset(set(filtered_countries.columns)):
-        st.error("Countries table must include 'Code' and 'Name'.")
-        st.stop()
-
-    filtered_countries = filtered_countries.dropna(subset=["Code", "Name"]).copy()
-    filtered_countries["Code"] = filtered_countries["Code"].astype(str).str.strip()
-    filtered_countries["Name"] = filtered_countries["Name"].astype(str).str.strip()
-    filtered_countries["_label"] = filtered_countries["Name"] + " (" + filtered_countries["Code"] + ")"
-    filtered_countries = filtered_countries.sort_values("_label")
 
-    options = filtered_countries["_label"].tolist()
+    sel_cont = st.selectbox("Continent", list(options_by_continent))
+    options = options_by_continent[sel_cont]
     default = options[:3] if len(options) >= 3 else options
 
     sel_labels = st.multiselect("Compare countries", options=options, default=default)
     if not sel_labels:
         st.info("Select at least one country.")
-        st.stop()
+        return
 
-    sel_codes = [x.split("(")[-1].replace(")", "").strip() for x in sel_labels]
-    subset = cities[cities["CountryCode"].isin(sel_codes)].copy()
+    sel_codes = [label_to_code[x] for x in sel_labels]
+    ranked = ranked_cities(cities)
+    subset = ranked[ranked["CountryCode"].isin(sel_codes)]
 
     st.divider()
     top_n = st.slider("Top N cities per country", 5, 30, 10, 5)
 
-    rows = []
-    for code in sel_codes:
-        g = subset[subset["CountryCode"] == code].dropna(subset=["Population"]).sort_values("Population", ascending=False)
-        top = g.head(top_n).copy()
-        top["ISO3"] = code
-        rows.append(top)
-
-    top_all = pd.concat(rows, ignore_index=True) if rows else subset.head(0)
+    top_all = subset[subset["rank"] <= top_n]
+    top_all = top_all.assign(ISO3=top_all["CountryCode"].astype(str)).reset_index(drop=True)
 
     left, right = st.columns([1.2, 1])
 
@@ -221,22 +304,21 @@ with tab_analytics:
             cols.append("District")
         cols.append("Population")
 
-        out = top_all[cols].copy()
-        out["Population"] = out["Population"].map(lambda x: f"{int(x):,}" if pd.notna(x) else "—")
-        st.dataframe(out.sort_values(["ISO3"], ascending=True), use_container_width=True)
+        out = top_all[cols].style.format({"Population": "{:,.0f}"}, na_rep="—")
+        st.dataframe(out, use_container_width=True, hide_index=True)
 
     with right:
         st.markdown("### Urban concentration (Top-10 share)")
-        conc = []
-        for code in sel_codes:
-            g = subset[subset["CountryCode"] == code].dropna(subset=["Population"]).sort_values("Population", ascending=False)
-            if g.empty:
-                continue
-            total = g["Population"].sum()
-            top10 = g["Population"].head(10).sum()
-            conc.append({"ISO3": code, "Top10_share": (top10 / total) if total else None})
-
-        conc_df = pd.DataFrame(conc)
+        conc = (
+            subset.assign(_top10=subset["Population"].where(subset["rank"] <= 10, 0))
+            .groupby("CountryCode", observed=True)
+            .agg(total=("Population", "sum"), top10=("_top10", "sum"))
+        )
+        conc = conc.set_axis(conc.index.astype(str)).reindex(sel_codes).dropna(subset=["total"])
+        conc_df = pd.DataFrame({
+            "ISO3": conc.index,
+            "Top10_share": (conc["top10"] / conc["total"]).where(conc["total"] != 0).to_numpy(),
+        })
         if conc_df.empty:
             st.write("—")
         else:
@@ -253,17 +335,25 @@ with tab_analytics:
     st.divider()
     st.markdown("### Rank–size curve (population distribution)")
 
-    rank_df = subset.dropna(subset=["Population"]).copy()
-    rank_df = rank_df.sort_values(["CountryCode", "Population"], ascending=[True, False])
-    rank_df["rank"] = rank_df.groupby("CountryCode").cumcount() + 1
-
     fig2 = px.scatter(
-        rank_df,
+        log_spaced_ranks(subset),
         x="rank",
         y="Population",
         color="CountryCode",
+        log_x=True,
+        log_y=True,
+        render_mode="webgl",
         template="plotly_dark",
         title="Rank vs population (compare distributions)",
     )
     fig2.update_layout(margin=dict(l=0, r=0, t=60, b=0))
     st.plotly_chart(fig2, use_container_width=True)
+
+
+tab_map, tab_analytics = st.tabs(["🗺️ City Map (Lat/Lon)", "📈 City Analytics (Population)"])
+
+with tab_map:
+    city_map_tab()
+
+with tab_analytics:
+    city_analytics_tab()
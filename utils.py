@@ -6,10 +6,17 @@ import pandas as pd
 import streamlit as st
 
 DATA_DIR = Path(__file__).parent / "data"
+CATEGORY_COLS = ("Continent", "Region", "Language")
+ISO3_COLS = ("Code", "CountryCode")
 
-def inject_global_css() -> None:
-    st.markdown(
-        """
+STUDENT_NAME = "Ezzat Bachour"
+MAJOR = "B.Sc. Psychology"
+UNIVERSITY = "Leuphana University Lüneburg"
+MATRICULATION_NUMBER = "3045988"
+SEMINAR_NAME = "Mastering Data Visualization with Python (S)"
+LECTURER_NAME = "Jorge Gustavo Rodríguez Aboytes"
+
+_CSS = """
 <style>
 /* Page padding */
 .block-container { padding-top: 1.2rem; padding-bottom: 2.5rem; max-width: 1200px; }
@@ -41,9 +48,10 @@ section[data-testid="stSidebar"] { border-right: 1px solid rgba(255,255,255,0.06
   opacity: 0.9;
 }
 </style>
-        """,
-        unsafe_allow_html=True,
-    )
+"""
+
+def inject_global_css() -> None:
+    st.markdown(_CSS, unsafe_allow_html=True)
 
 def render_hero(icon: str, title: str, subtitle: str, pill: str | None = None) -> None:
     pill_html = f'<span class="pop-pill">{pill}</span>' if pill else ""
@@ -70,41 +78,86 @@ def format_int(x) -> str:
         return "—"
 
 
-@st.cache_data(show_spinner=False)
+@st.cache_data(show_spinner=False, persist="disk")
+def _parse_csv(path: Path, mtime_ns: int, size: int) -> pd.DataFrame:
+    # mtime_ns/size are only cache-key parts, so an edited or replaced file is re-parsed.
+    return pd.read_csv(path, engine="pyarrow")
+
 def _read_csv(path: Path) -> pd.DataFrame | None:
-    if not path.exists():
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
         return None
-    return pd.read_csv(path)
+    return _parse_csv(path, stat.st_mtime_ns, stat.st_size)
+
+def frame_key(df: pd.DataFrame) -> int:
+    """Content hash of a frame, for cache keys of helpers that take it unhashed."""
+    return int(pd.util.hash_pandas_object(df, index=False).sum())
 
 def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df.columns = [c.strip() for c in df.columns]
-    return df
+    cols = [c.strip() for c in df.columns]
+    if cols == list(df.columns):
+        return df
+    return df.set_axis(cols, axis=1)
 
 def _coerce_bool_official(series: pd.Series) -> pd.Series:
-    s = series.copy()
-    if s.dtype == object:
-        s = s.astype(str).str.strip().str.upper().replace({"TRUE":"T","FALSE":"F","YES":"T","NO":"F"})
-        return s.isin(["T", "1", "Y"])
+    s = series
+    if pd.api.types.is_bool_dtype(s):
+        return s
+    if not pd.api.types.is_numeric_dtype(s):
+        # Only a handful of distinct spellings exist, so normalize those and
+        # broadcast back through the factorized codes.
+        codes, uniques = pd.factorize(s)
+        flags = pd.Index(uniques).astype(str).str.strip().str.upper().isin(["T", "TRUE", "1", "Y", "YES"])
+        return pd.Series(np.append(flags, False)[codes], index=s.index)
     return s.astype(bool)
 
+def prep_tables(
+    cities: pd.DataFrame,
+    countries: pd.DataFrame,
+    langs: pd.DataFrame,
+    worldcities: pd.DataFrame | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame | None]:
+    """
+    Canonicalize the loaded tables once: strip column names, make Population
+    numeric and IsOfficial a bool, and store CATEGORY_COLS as categoricals.
+    The ISO3 keys of all three tables share one CategoricalDtype so joins
+    and comparisons between them use codes.
+    """
+    cities = normalize_columns(cities)
+    countries = normalize_columns(countries)
+    langs = normalize_columns(langs)
+    if worldcities is not None:
+        worldcities = normalize_columns(worldcities)
+
+    if "Population" in countries.columns:
+        countries = countries.assign(Population=pd.to_numeric(countries["Population"], errors="coerce"))
+    if "Population" in cities.columns:
+        cities = cities.assign(Population=pd.to_numeric(cities["Population"], errors="coerce"))
+    if "IsOfficial" in langs.columns:
+        langs = langs.assign(IsOfficial=_coerce_bool_official(langs["IsOfficial"]))
+
+    tables = (cities, countries, langs)
+    iso3 = pd.CategoricalDtype(sorted(set().union(
+        *(df[c].dropna().astype(str) for df in tables for c in ISO3_COLS if c in df.columns)
+    )))
+
+    def _categorize(df: pd.DataFrame) -> pd.DataFrame:
+        cats = {c: df[c].astype("category") for c in CATEGORY_COLS if c in df.columns}
+        cats.update({c: df[c].astype(iso3) for c in ISO3_COLS if c in df.columns})
+        return df.assign(**cats) if cats else df
+
+    return _categorize(cities), _categorize(countries), _categorize(langs), worldcities
+
+@st.cache_resource(show_spinner=False)
 def get_data() -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame | None]:
     """
     Returns: (cities, countries, languages, worldcities_or_None)
 
-    Also ensures st.session_state has:
-      - "cities", "countries", "languages", "worldcities"
-    so pages can be opened directly (Streamlit Cloud users often do).
+    The frames are loaded once per process and shared by every session,
+    so pages can call this directly (Streamlit Cloud users often open a
+    page without going through Home). Treat them as read-only.
     """
-    keys = {"cities", "countries", "languages", "worldcities"}
-    if keys.issubset(st.session_state.keys()):
-        return (
-            st.session_state["cities"],
-            st.session_state["countries"],
-            st.session_state["languages"],
-            st.session_state["worldcities"],
-        )
-
     cities = _read_csv(DATA_DIR / "city.csv")
     countries = _read_csv(DATA_DIR / "country.csv")
     langs = _read_csv(DATA_DIR / "countrylanguage.csv")
@@ -118,23 +171,27 @@ def get_data() -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame |
         if langs is None: missing.append("data/countrylanguage.csv")
         raise FileNotFoundError(f"Missing required dataset file(s): {', '.join(missing)}")
 
-    cities = normalize_columns(cities)
-    countries = normalize_columns(countries)
-    langs = normalize_columns(langs)
-    if worldcities is not None:
-        worldcities = normalize_columns(worldcities)
-
-    st.session_state["cities"] = cities
-    st.session_state["countries"] = countries
-    st.session_state["languages"] = langs
-    st.session_state["worldcities"] = worldcities
+    cities, countries, langs, worldcities = prep_tables(cities, countries, langs, worldcities)
 
     return cities, countries, langs, worldcities
 
+@st.cache_resource(show_spinner=False)
+def get_snapshot() -> dict[str, str]:
+    """Preformatted row counts for the metric widgets."""
+    cities, countries, langs, worldcities = get_data()
+    return {
+        "countries": format_int(len(countries)),
+        "cities": format_int(len(cities)),
+        "langs": format_int(len(langs)),
+        "unique_langs": format_int(langs["Language"].nunique()) if "Language" in langs.columns else "—",
+        "worldcities": format_int(len(worldcities)) if worldcities is not None else "—",
+    }
 
+
+@st.cache_data(show_spinner=False, persist="disk")
 def build_country_language_stats(countries: pd.DataFrame, langs: pd.DataFrame) -> pd.DataFrame:
-    c = countries.copy()
-    l = langs.copy()
+    c = countries
+    l = langs
 
     if "CountryCode" not in l.columns and "Code" in l.columns:
         l = l.rename(columns={"Code": "CountryCode"})
@@ -143,69 +200,113 @@ def build_country_language_stats(countries: pd.DataFrame, langs: pd.DataFrame) -
         if cand:
             l = l.rename(columns={cand[0]: "Language"})
 
-    grp = l.groupby("CountryCode", dropna=False)
-    out = pd.DataFrame({
-        "Code": grp["Language"].nunique(),
-    }).rename(columns={"Code": "n_languages"})
-    out.index.name = "Code"
-    out = out.reset_index()
-
+    aggs = {"n_languages": ("Language", "nunique")}
     if "IsOfficial" in l.columns:
-        is_off = _coerce_bool_official(l["IsOfficial"])
-        tmp = l.assign(_is_off=is_off).groupby("CountryCode")["_is_off"].sum().reset_index()
-        tmp.columns = ["Code", "n_official"]
-        out = out.merge(tmp, on="Code", how="left")
-    else:
+        l = l.assign(_is_off=_coerce_bool_official(l["IsOfficial"]))
+        aggs["n_official"] = ("_is_off", "sum")
+
+    out = (
+        l.groupby("CountryCode", dropna=False, observed=True, sort=False)
+        .agg(**aggs)
+        .rename_axis("Code")
+        .reset_index()
+    )
+    if "n_official" not in out.columns:
         out["n_official"] = np.nan
 
+    p = np.empty(0)
     if "Percentage" in l.columns:
-        perc = pd.to_numeric(l["Percentage"], errors="coerce")
-        l2 = l.assign(_p=perc).dropna(subset=["_p"])
-        if not l2.empty:
-            l2["_p"] = l2["_p"] / 100.0
-            def _entropy(p):
-                p = p[p > 0]
-                return float(-(p * np.log(p)).sum()) if len(p) else np.nan
-            ent = l2.groupby("CountryCode")["_p"].apply(_entropy).reset_index()
-            ent.columns = ["Code", "entropy"]
-            out = out.merge(ent, on="Code", how="left")
-        else:
-            out["entropy"] = np.nan
+        p = pd.to_numeric(l["Percentage"], errors="coerce").to_numpy(dtype=float) / 100.0
+    if (p > 0).any():
+        # Shannon entropy -sum(p * log p) over each country's positive shares,
+        # from bincounts over the factorized country keys in one array pass.
+        inv, keys = pd.factorize(l["CountryCode"])
+        m = (p > 0) & (inv >= 0)
+        inv, p = inv[m], p[m]
+        plogp = np.bincount(inv, weights=p * np.log(p), minlength=len(keys))
+        seen = np.bincount(inv, minlength=len(keys)) > 0
+        ent = pd.Series(np.where(seen, -plogp, np.nan), index=keys)
+        out["entropy"] = ent.reindex(out["Code"]).to_numpy()
     else:
         out["entropy"] = np.nan
 
     if "Code" not in c.columns and "CountryCode" in c.columns:
         c = c.rename(columns={"CountryCode": "Code"})
-    keep = [x for x in ["Code", "Name", "Continent", "Region", "Population"] if x in c.columns]
-    out = out.merge(c[keep], on="Code", how="left")
+    keep = [x for x in ["Name", "Continent", "Region", "Population"] if x in c.columns]
+    out = out.join(c.set_index("Code")[keep], on="Code")
 
     for col in ["n_languages", "n_official"]:
         if col in out.columns:
-            out[col] = pd.to_numeric(out[col], errors="coerce").fillna(0)
+            out[col] = pd.to_numeric(out[col], errors="coerce").fillna(0).astype(np.int32)
+    # Plotly ships numeric arrays as typed binary, so narrower dtypes mean fewer bytes per figure.
+    out["entropy"] = out["entropy"].astype(np.float32)
 
     if "Population" in out.columns:
         out["Population"] = pd.to_numeric(out["Population"], errors="coerce")
 
     return out
 
+@st.cache_data(show_spinner=False)
 def build_global_language_stats(langs: pd.DataFrame, countries: pd.DataFrame | None = None) -> pd.DataFrame:
-    l = langs.copy()
+    l = langs
     if "Language" not in l.columns:
         return pd.DataFrame(columns=["Language", "countries_spoken", "official_countries"])
 
-    by_lang = l.groupby("Language")["CountryCode"].nunique().reset_index()
-    by_lang.columns = ["Language", "countries_spoken"]
+    # Distinct (language, country) pairs over the factorized keys, counted per
+    # language; the official count is the same over the official rows only.
+    lang_codes, lang_keys = pd.factorize(l["Language"], sort=True)
+    cc_codes, cc_keys = pd.factorize(l["CountryCode"])
+    n_cc = max(len(cc_keys), 1)
+    valid = (lang_codes >= 0) & (cc_codes >= 0)
+    pair_ids = lang_codes.astype(np.int64) * n_cc + cc_codes
 
+    def _countries_per_lang(mask: np.ndarray) -> np.ndarray:
+        pairs = np.unique(pair_ids[mask])
+        return np.bincount(pairs // n_cc, minlength=len(lang_keys))
+
+    by_lang = pd.DataFrame({"Language": lang_keys, "countries_spoken": _countries_per_lang(valid)})
     if "IsOfficial" in l.columns:
-        is_off = _coerce_bool_official(l["IsOfficial"])
-        l2 = l.assign(_is_off=is_off)
-        off = l2[l2["_is_off"]].groupby("Language")["CountryCode"].nunique().reset_index()
-        off.columns = ["Language", "official_countries"]
-        by_lang = by_lang.merge(off, on="Language", how="left")
+        off = _coerce_bool_official(l["IsOfficial"]).to_numpy(dtype=bool)
+        by_lang["official_countries"] = _countries_per_lang(valid & off)
     else:
-        by_lang["official_countries"] = np.nan
+        by_lang["official_countries"] = 0
 
-    by_lang["official_countries"] = pd.to_numeric(by_lang["official_countries"], errors="coerce").fillna(0).astype(int)
-    by_lang = by_lang.sort_values("countries_spoken", ascending=False)
+    by_lang = by_lang.sort_values("countries_spoken", ascending=False, ignore_index=True)
 
     return by_lang
+
+@st.cache_data(show_spinner=False)
+def choropleth_fig(stats: pd.DataFrame, color: str, title: str, hover_cols: tuple[str, ...] = ()) -> dict:
+    """ISO-3 choropleth of one stats column, returned as a dict so reruns reuse it."""
+    import plotly.express as px
+
+    fig = px.choropleth(
+        stats,
+        locations="Code",
+        locationmode="ISO-3",
+        color=color,
+        hover_name="Name" if "Name" in stats.columns else None,
+        hover_data={k: True for k in hover_cols if k in stats.columns} or None,
+        template="plotly_dark",
+        title=title,
+    )
+    fig.update_layout(margin=dict(l=0, r=0, t=60, b=0), height=520)
+    return fig.to_dict()
+
+@st.cache_data(show_spinner=False)
+def population_scatter_fig(stats: pd.DataFrame, title: str) -> dict:
+    """Population vs n_languages per country, coloured by continent when available."""
+    import plotly.express as px
+
+    df = stats.dropna(subset=["Population", "n_languages"])
+    fig = px.scatter(
+        df,
+        x="Population",
+        y="n_languages",
+        hover_name="Name" if "Name" in df.columns else None,
+        color="Continent" if "Continent" in df.columns else None,
+        template="plotly_dark",
+        title=title,
+    )
+    fig.update_layout(margin=dict(l=0, r=0, t=60, b=0))
+    return fig.to_dict()